@@ -3,33 +3,45 @@ import tempfile
 import os
 from datetime import datetime
 import io
-import requests
-import base64
-from logger import logger
+from logger import logger, start_run, bind_run, run_stage, record_rows, end_run
+from update_check import read_local_version, start_update_check
 
-def check_for_updates():
+def settle_update_check():
+    # Replace a finished future with its result message; failures are logged here, once
+    future = st.session_state.pop('update_future')
     try:
-        # Read local version
-        with open('VERSION.md', 'r', encoding='utf-8') as f:
-            local_content = f.read()
-        local_version = local_content.split('\n')[0].replace('# Version ', '')
-
-        # Assume GitHub repo URL
-        repo_url = "https://api.github.com/repos/example/repo/contents/VERSION.md"
-        response = requests.get(repo_url)
-        if response.status_code == 200:
-            data = response.json()
-            remote_content = base64.b64decode(data['content']).decode('utf-8')
-            remote_version = remote_content.split('\n')[0].replace('# Version ', '')
-            if remote_version != local_version:
-                st.info(f"有新版本可用: {remote_version} (當前: {local_version})")
-            else:
-                st.success("已是最新版本")
+        local_version = read_local_version()
+        remote_version = future.result()
+        if remote_version != local_version:
+            st.session_state.update_result = ('info', f"有新版本可用: {remote_version} (當前: {local_version})")
         else:
-            st.error("無法檢查更新")
+            st.session_state.update_result = ('success', "已是最新版本")
     except Exception as e:
         logger.error(f"Error checking updates: {str(e)}")
-        st.error("檢查更新失敗")
+        st.session_state.update_result = ('error', "檢查更新失敗")
+
+@st.fragment(run_every=1)
+def update_check_status():
+    # Polls only while the background check is pending, then hands over to a full rerun
+    if 'update_future' not in st.session_state:
+        return
+    if not st.session_state.update_future.done():
+        st.info("正在檢查更新...")
+        return
+    settle_update_check()
+    st.rerun()
+
+def check_for_updates():
+    # Report the background check started by the sidebar button, without waiting on it
+    if 'update_future' in st.session_state:
+        if st.session_state.update_future.done():
+            settle_update_check()
+        else:
+            update_check_status()
+    if 'update_result' in st.session_state:
+        # Shown once; the next rerun clears it
+        level, message = st.session_state.pop('update_result')
+        getattr(st, level)(message)
 
 # Dependency check
 try:
@@ -37,7 +49,7 @@ try:
     import numpy as np
     import openpyxl
     from data_preprocessing import load_and_preprocess
-    from business_logic import calculate_demand
+    from business_logic import calculate_demand, select_rows, index_options, sort_options
     from visualization import create_visualizations
 except ImportError as e:
     logger.error(f"Import error: {str(e)}")
@@ -87,7 +99,8 @@ with st.sidebar:
     st.write("Version: v1.0")
 
     if st.button("檢查更新", key="update_check"):
-        check_for_updates()
+        st.session_state.update_future = start_update_check()
+    check_for_updates()
 
     st.header("參數設定")
     lead_time = st.slider("Lead Time (days)", min_value=2.0, max_value=5.0, value=2.0, step=0.5)
@@ -109,6 +122,11 @@ if 'df_results' not in st.session_state:
     st.session_state.df_results = pd.DataFrame()
 if 'summary' not in st.session_state:
     st.session_state.summary = pd.DataFrame()
+if 'group_index' not in st.session_state:
+    st.session_state.group_index = {}
+
+# Tag this rerun's log records with the session's last analysis run
+bind_run(st.session_state.get('run'))
 
 with tab1:
     st.header("數據上傳與分析")
@@ -118,7 +136,11 @@ with tab1:
     if file_a and file_b:
         if st.button("開始分析", key="analyze"):
             # Process in memory
-            df_raw = load_and_preprocess(file_a.getvalue(), file_b.getvalue())
+            file_a_bytes, file_b_bytes = file_a.getvalue(), file_b.getvalue()
+            st.session_state.run = start_run(file_a_bytes, file_b_bytes)
+            with run_stage('load_and_preprocess'):
+                df_raw = load_and_preprocess(file_a_bytes, file_b_bytes)
+            record_rows('raw', len(df_raw))
 
             if not df_raw.empty:
                 # Data preview
@@ -132,7 +154,12 @@ with tab1:
                 # Calculate demand
                 status_text.text("正在分析中...")
                 progress_bar.progress(50)
-                df_results, summary = calculate_demand(df_raw.copy(), lead_time)
+                # The group index built for the summary is reused by the result filters and charts
+                with run_stage('calculate_demand'):
+                    df_results, summary, group_index = calculate_demand(df_raw.copy(), lead_time)
+                record_rows('results', len(df_results))
+                record_rows('summary', len(summary))
+                end_run('ok' if not df_results.empty else 'failed')
                 progress_bar.progress(100)
                 status_text.text("分析完成！")
 
@@ -140,26 +167,50 @@ with tab1:
                 st.session_state.df_raw = df_raw
                 st.session_state.df_results = df_results
                 st.session_state.summary = summary
+                st.session_state.group_index = group_index
 
                 st.success("✅ 分析完成！")
                 st.rerun()  # Refresh to show other tabs
             else:
+                end_run('failed')
                 st.error("處理數據失敗。請檢查上方錯誤訊息。")
 
 with tab2:
     st.header("計算結果")
     if not st.session_state.df_results.empty:
+        df_results = st.session_state.df_results
+        summary = st.session_state.summary
+        group_index = st.session_state.group_index
+
+        # Group No. / SKU / Site drill-down via precomputed row offsets
+        group_options = ['All'] + index_options(group_index, 'group')
+        selected_group = st.selectbox("選擇組別編號篩選結果", group_options, key="results_group")
+        group = None if selected_group == 'All' else selected_group
+        group_summary = select_rows(summary, group_index, parts=('summary',), group=group)
+
+        article_options = ['All'] + sort_options(group_summary['Article'].unique().tolist())
+        selected_article = st.selectbox("選擇 SKU 篩選結果", article_options, key="results_article")
+        article = None if selected_article == 'All' else selected_article
+
+        site_options = ['All'] + index_options(group_index, 'site', parts=('d001', 'non_d001'))
+        selected_site = st.selectbox("選擇站點篩選詳細結果", site_options, key="results_site")
+        site = None if selected_site == 'All' else selected_site
+
+        df_results = select_rows(df_results, group_index, parts=('d001', 'non_d001'), group=group, article=article, site=site)
+        summary = select_rows(summary, group_index, parts=('summary',), group=group, article=article)
+
         st.subheader("詳細計算結果")
-        st.dataframe(st.session_state.df_results, width='stretch')
+        st.dataframe(df_results, width='stretch')
         st.subheader("總結報告 (按組別與SKU)")
-        st.dataframe(st.session_state.summary, width='stretch')
+        st.dataframe(summary, width='stretch')
     else:
         st.info("請先上傳檔案並進行分析。")
 
 with tab3:
     st.header("視覺化分析")
     if not st.session_state.df_results.empty:
-        create_visualizations(st.session_state.df_results, st.session_state.summary)
+        with run_stage('create_visualizations'):
+            create_visualizations(st.session_state.df_results, st.session_state.summary, st.session_state.group_index)
     else:
         st.info("請先上傳檔案並進行分析。")
 
@@ -181,13 +232,6 @@ with tab4:
 
 # Sidebar
 with st.sidebar:
-    st.header("Developer Info")
-    st.write("Developer: Ricky")
-    st.write("Version: v1.0")
-
-    if st.button("檢查更新"):
-        check_for_updates()
-
     st.header("File Format Notes")
     with st.expander("File A (Inventory and Sales Data)"):
         st.write("Required columns: Article, Article Description, RP Type, Site, MOQ, SaSa Net Stock, Pending Received, Safety Stock, Last Month Sold Qty, MTD Sold Qty, Supply source, Description p. group")
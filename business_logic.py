@@ -2,6 +2,93 @@ import pandas as pd
 import numpy as np
 from logger import logger
 
+INDEX_KEYS = (('group', 'Group No.'), ('article', 'Article'), ('site', 'Site'))
+SUMMARY_INDEX_KEYS = (('group', 'Group No.'), ('article', 'Article'))
+
+def _index_part(df, rows, keys=INDEX_KEYS):
+    sub = df.iloc[rows]
+    part = {'rows': rows}
+    for key, col in keys:
+        part[key] = {value: rows[offsets] for value, offsets in sub.groupby(col).indices.items()}
+    return part
+
+def index_summary(index, summary):
+    """
+    Add the summary's Group No. / Article offsets to an index (the summary has no Site column).
+    """
+    if not summary.empty:
+        index['summary'] = _index_part(summary, np.arange(len(summary)), SUMMARY_INDEX_KEYS)
+    return index
+
+def build_group_index(df, summary=None):
+    """
+    Build row offsets per Group No., Article and Site, with D001 rows split out once.
+
+    Parameters:
+    df (pd.DataFrame): Results DataFrame from calculate_demand
+    summary (pd.DataFrame): Optional summary DataFrame from calculate_demand
+
+    Returns:
+    dict: {'d001'|'non_d001': {'rows': offsets, 'group'|'article'|'site': {value: offsets}},
+           'summary': {'rows': offsets, 'group'|'article': {value: offsets}}}
+    """
+    is_d001 = (df['Site'] == 'D001').to_numpy()
+    index = {
+        'd001': _index_part(df, np.flatnonzero(is_d001)),
+        'non_d001': _index_part(df, np.flatnonzero(~is_d001))
+    }
+    if summary is not None:
+        index_summary(index, summary)
+    return index
+
+def sort_options(values):
+    """
+    Sort selectbox values; numbers first, then strings, so mixed Group No. types (e.g. 0 and 'G1') do not raise.
+    """
+    return sorted(values, key=lambda value: (isinstance(value, str), value))
+
+def index_options(index, key, parts=('summary',)):
+    """
+    Sorted lookup values of one index key across parts, e.g. every Group No. in the summary.
+    """
+    values = set()
+    for part in parts:
+        values.update(index.get(part, {}).get(key, {}))
+    return sort_options(values)
+
+def select_rows(df, index, parts=('non_d001',), **filters):
+    """
+    Slice df by precomputed offsets instead of a boolean scan of the full frame.
+
+    Parameters:
+    df (pd.DataFrame): DataFrame the index was built from
+    index (dict): Output of build_group_index
+    parts (tuple): Index parts to combine, e.g. ('d001', 'non_d001') or ('summary',)
+    **filters: Index key to value, e.g. group=1, article='A1'; None values and keys a part
+               does not have (site on the summary) are ignored
+
+    Returns:
+    pd.DataFrame: Selected rows in original order
+    """
+    empty = np.array([], dtype=np.intp)
+    rows = []
+    for name in parts:
+        if name not in index:
+            continue
+        part = index[name]
+        selected = None
+        for key, value in filters.items():
+            if value is None or key not in part:
+                continue
+            offsets = part[key].get(value, empty)
+            selected = offsets if selected is None else np.intersect1d(selected, offsets, assume_unique=True)
+        rows.append(part['rows'] if selected is None else selected)
+    if not rows:
+        return df.iloc[empty]
+    if len(rows) == 1:
+        return df.iloc[rows[0]]
+    return df.iloc[np.sort(np.concatenate(rows))]
+
 def calculate_demand(df, lead_time=2):
     """
     Calculate demand-related metrics based on the preprocessed DataFrame.
@@ -11,10 +98,10 @@ def calculate_demand(df, lead_time=2):
     lead_time (int): Lead time in days, defaults to 2
 
     Returns:
-    tuple: (df with added columns, summary_df)
+    tuple: (df with added columns, summary_df, group index from build_group_index)
     """
     if df.empty:
-        return pd.DataFrame(), pd.DataFrame()
+        return pd.DataFrame(), pd.DataFrame(), {}
 
     try:
         # Daily Sales Rate = max(0, Last Month Sold Qty / 30)
@@ -79,8 +166,12 @@ def calculate_demand(df, lead_time=2):
         df['Notes'] = df['Notes'].apply(lambda x: f"{x}; Lead Time={lead_time}" if x else f"Lead Time={lead_time}")
 
         # Summary table by Group No. and Article (SKU)
+        # One group index per analysis: D001 rows are split out here and reused by the app
+        index = build_group_index(df)
+        non_d001 = select_rows(df, index)
+        d001 = select_rows(df, index, parts=('d001',))
+
         # Aggregate for non-D001 sites
-        non_d001 = df[df['Site'] != 'D001']
         summary_non_d001 = non_d001.groupby(['Group No.', 'Article']).agg(
             Total_Demand=('Total Demand', 'sum'),
             Total_Stock=('SaSa Net Stock', 'sum'),
@@ -89,24 +180,26 @@ def calculate_demand(df, lead_time=2):
         ).reset_index()
         summary_non_d001['Total_Stock_Available'] = summary_non_d001['Total_Stock'] + summary_non_d001['Total_Pending']
 
-        # D001 data
-        d001_data = df[df['Site'] == 'D001'][['Group No.', 'Article', 'SaSa Net Stock', 'In Quality Insp.', 'Blocked', 'Pending Received']].rename(columns={
+        # D001 data ('In Quality Insp.' and 'Blocked' are optional in File A)
+        d001_cols = {
             'SaSa Net Stock': 'D001_SaSa_Net_Stock',
             'In Quality Insp.': 'D001_In_Quality_Insp',
             'Blocked': 'D001_Blocked',
             'Pending Received': 'D001_Pending_Received'
-        })
+        }
+        d001_data = d001.reindex(columns=['Group No.', 'Article'] + list(d001_cols), fill_value=0).rename(columns=d001_cols)
 
-        # Merge
-        df_agg = summary_non_d001.merge(d001_data, on=['Group No.', 'Article'], how='left').fillna(0)
+        # Merge, filling only the D001 columns for SKUs without a D001 row
+        df_agg = summary_non_d001.merge(d001_data, on=['Group No.', 'Article'], how='left')
+        df_agg[list(d001_cols.values())] = df_agg[list(d001_cols.values())].fillna(0)
 
         # Out_of_Stock_Warning
-        d001_total_stock = df[df['Site'] == 'D001']['SaSa Net Stock'].sum()
+        d001_total_stock = d001['SaSa Net Stock'].sum()
         df_agg['Out_of_Stock_Warning'] = np.where(
             df_agg['Total_Dispatch'] > d001_total_stock, 'D001 缺貨', ''
         )
 
-        return df, df_agg
+        return df, df_agg, index_summary(index, df_agg)
     except Exception as e:
         logger.error(f"Error in calculate_demand: {str(e)}")
-        return pd.DataFrame(), pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame(), pd.DataFrame(), {}
\ No newline at end of file
@@ -3,16 +3,25 @@ import streamlit as st
 import os
 import io
 from logger import logger
+from file_validation import validate_xlsx
+
+REQUIRED_COLS_A = ['Article', 'Article Description', 'RP Type', 'Site', 'MOQ', 'SaSa Net Stock', 'Pending Received', 'Safety Stock', 'Last Month Sold Qty', 'MTD Sold Qty', 'Supply source', 'Description p. group']
+REQUIRED_COLS_B1 = ['Group No.', 'Article', 'SKU Target', 'Target Type', 'Promotion Days', 'Target Cover Days']
+REQUIRED_COLS_B2 = ['Site', 'Shop Target(HK)', 'Shop Target(MO)', 'Shop Target(ALL)']
 
 def load_and_preprocess(file_a_bytes, file_b_bytes):
     try:
+        # Pre-flight: check size, sheets and header rows before any full parse
+        errors = validate_xlsx(file_a_bytes, {0: REQUIRED_COLS_A}, 'File A')
+        errors += validate_xlsx(file_b_bytes, {'Sheet 1': REQUIRED_COLS_B1, 'Sheet 2': REQUIRED_COLS_B2}, 'File B')
+        if errors:
+            for error in errors:
+                st.error(error)
+            return pd.DataFrame()
+
         # Load File A
         df_a = pd.read_excel(io.BytesIO(file_a_bytes))
         df_a_original = df_a.copy()
-        required_cols_a = ['Article', 'Article Description', 'RP Type', 'Site', 'MOQ', 'SaSa Net Stock', 'Pending Received', 'Safety Stock', 'Last Month Sold Qty', 'MTD Sold Qty', 'Supply source', 'Description p. group']
-        if not all(col in df_a.columns for col in required_cols_a):
-            st.error("File A 缺少必要欄位。")
-            return pd.DataFrame()
 
         # Preprocess File A
         df_a['Article'] = df_a['Article'].astype(str).str.strip()
@@ -57,10 +66,6 @@ def load_and_preprocess(file_a_bytes, file_b_bytes):
 
         # Load File B Sheet1
         df_b1 = pd.read_excel(io.BytesIO(file_b_bytes), sheet_name='Sheet 1')
-        required_cols_b1 = ['Group No.', 'Article', 'SKU Target', 'Target Type', 'Promotion Days', 'Target Cover Days']
-        if not all(col in df_b1.columns for col in required_cols_b1):
-            st.error("File B Sheet1 缺少必要欄位。")
-            return pd.DataFrame()
 
         df_b1['Article'] = df_b1['Article'].astype(str).str.strip()
         numeric_cols_b1 = ['SKU Target', 'Promotion Days', 'Target Cover Days']
@@ -70,10 +75,6 @@ def load_and_preprocess(file_a_bytes, file_b_bytes):
 
         # Load File B Sheet2
         df_b2 = pd.read_excel(io.BytesIO(file_b_bytes), sheet_name='Sheet 2')
-        required_cols_b2 = ['Site', 'Shop Target(HK)', 'Shop Target(MO)', 'Shop Target(ALL)']
-        if not all(col in df_b2.columns for col in required_cols_b2):
-            st.error("File B Sheet2 缺少必要欄位。")
-            return pd.DataFrame()
 
         df_b2['Site'] = df_b2['Site'].astype(str).str.strip()
         numeric_cols_b2 = ['Shop Target(HK)', 'Shop Target(MO)', 'Shop Target(ALL)']
@@ -106,4 +107,4 @@ def load_and_preprocess(file_a_bytes, file_b_bytes):
     except Exception as e:
         logger.error(f"Error in load_and_preprocess: {str(e)}")
         st.error(f"處理文件時發生錯誤: {str(e)}")
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
\ No newline at end of file
@@ -0,0 +1,180 @@
+import re
+import zipfile
+import io
+import posixpath
+import xml.etree.ElementTree as ET
+from logger import logger
+
+# Upload limits (see README: 檔案大小限制為 10MB)
+MAX_FILE_SIZE = 10 * 1024 * 1024
+MAX_ROWS = 200000
+
+NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+NS_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+def _sheet_paths(zf):
+    """
+    Map sheet names to their worksheet XML paths inside the .xlsx archive, in workbook order.
+    """
+    rels = {}
+    with zf.open('xl/_rels/workbook.xml.rels') as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag == NS_PKG_REL + 'Relationship':
+                target = elem.get('Target', '')
+                if target.startswith('/'):
+                    path = target.lstrip('/')
+                else:
+                    path = posixpath.normpath(posixpath.join('xl', target))
+                rels[elem.get('Id')] = path
+
+    sheets = []
+    with zf.open('xl/workbook.xml') as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag == NS_MAIN + 'sheet':
+                sheets.append((elem.get('name'), rels.get(elem.get(NS_REL + 'id'))))
+    return sheets
+
+
+def _string_item_text(elem):
+    """
+    Text of an <si> or <is> element from its <t> and rich-text <r><t> runs; <rPh> phonetic runs are skipped, as openpyxl does.
+    """
+    parts = []
+    for child in elem:
+        if child.tag == NS_MAIN + 't':
+            parts.append(child.text or '')
+        elif child.tag == NS_MAIN + 'r':
+            parts += [t.text or '' for t in child.findall(NS_MAIN + 't')]
+    return ''.join(parts)
+
+
+def _shared_strings(zf, indexes):
+    """
+    Resolve only the requested shared string indexes, stopping once the largest is reached.
+    """
+    if not indexes or 'xl/sharedStrings.xml' not in zf.namelist():
+        return {}
+    wanted = set(indexes)
+    last = max(wanted)
+    result = {}
+    i = 0
+    with zf.open('xl/sharedStrings.xml') as f:
+        for _, elem in ET.iterparse(f):
+            if elem.tag != NS_MAIN + 'si':
+                continue
+            if i in wanted:
+                result[i] = _string_item_text(elem)
+            elem.clear()
+            if i >= last:
+                break
+            i += 1
+    return result
+
+
+def _row_count_from_dimension(ref):
+    """
+    Estimate the number of rows from a sheet dimension such as 'A1:L500'.
+    """
+    rows = [int(n) for n in re.findall(r'[A-Z]+(\d+)', ref or '')]
+    if not rows:
+        return None
+    return max(rows) - min(rows) + 1
+
+
+def _read_header_row(zf, path):
+    """
+    Stream a worksheet until the end of its first row.
+
+    Returns:
+    tuple: (list of raw header cells as (type, value), estimated row count or None)
+    """
+    cells = []
+    row_count = None
+    with zf.open(path) as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start' and elem.tag == NS_MAIN + 'dimension':
+                row_count = _row_count_from_dimension(elem.get('ref'))
+            elif event == 'end' and elem.tag == NS_MAIN + 'c':
+                cell_type = elem.get('t', 'n')
+                if cell_type == 'inlineStr':
+                    inline = elem.find(NS_MAIN + 'is')
+                    value = _string_item_text(inline) if inline is not None else None
+                else:
+                    v = elem.find(NS_MAIN + 'v')
+                    value = v.text if v is not None else None
+                if value is not None:
+                    cells.append((cell_type, value))
+            elif event == 'end' and elem.tag == NS_MAIN + 'row':
+                break
+    return cells, row_count
+
+
+def read_xlsx_headers(file_bytes):
+    """
+    Read sheet names, header rows and estimated row counts from an .xlsx without parsing cell data.
+
+    Parameters:
+    file_bytes (bytes): Raw .xlsx content
+
+    Returns:
+    dict: {sheet name: {'columns': list of header names, 'rows': estimated row count incl. header or None}},
+          in workbook order
+    """
+    sheets = {}
+    with zipfile.ZipFile(io.BytesIO(file_bytes)) as zf:
+        raw = {}
+        for name, path in _sheet_paths(zf):
+            raw[name] = _read_header_row(zf, path) if path else ([], None)
+
+        shared_indexes = [int(value) for cells, _ in raw.values() for cell_type, value in cells if cell_type == 's']
+        shared = _shared_strings(zf, shared_indexes)
+
+    for name, (cells, row_count) in raw.items():
+        columns = [shared.get(int(value), '') if cell_type == 's' else value for cell_type, value in cells]
+        sheets[name] = {'columns': columns, 'rows': row_count}
+    return sheets
+
+
+def validate_xlsx(file_bytes, required, label):
+    """
+    Pre-flight check of an uploaded .xlsx before it is handed to pd.read_excel.
+
+    Parameters:
+    file_bytes (bytes): Raw .xlsx content
+    required (dict): {sheet name or 0 for the first sheet: list of required columns}
+    label (str): File label used in error messages, e.g. 'File A'
+
+    Returns:
+    list: Error messages; empty if the file can be parsed
+    """
+    if len(file_bytes) > MAX_FILE_SIZE:
+        return [f"{label} 超過檔案大小限制 {MAX_FILE_SIZE // (1024 * 1024)}MB。"]
+
+    try:
+        sheets = read_xlsx_headers(file_bytes)
+    except Exception as e:
+        logger.error(f"Error reading {label} headers: {str(e)}")
+        return [f"{label} 不是有效的 xlsx 檔案。"]
+
+    errors = []
+    sheet_names = list(sheets)
+    for sheet, cols in required.items():
+        if sheet == 0:
+            if not sheet_names:
+                errors.append(f"{label} 沒有工作表。")
+                continue
+            info, sheet_label = sheets[sheet_names[0]], label
+        elif sheet not in sheets:
+            errors.append(f"{label} 缺少工作表 '{sheet}'。")
+            continue
+        else:
+            info, sheet_label = sheets[sheet], f"{label} {sheet}"
+
+        missing = [col for col in cols if col not in info['columns']]
+        if missing:
+            errors.append(f"{sheet_label} 缺少必要欄位: {', '.join(missing)}")
+        if info['rows'] is not None and info['rows'] - 1 > MAX_ROWS:
+            errors.append(f"{sheet_label} 行數約 {info['rows'] - 1:,}，超過上限 {MAX_ROWS:,}。")
+    return errors
@@ -1,21 +1,166 @@
 import logging
-import os
+import logging.handlers
+import json
+import time
+import uuid
+import queue
+import copy
+import atexit
+import hashlib
+import contextvars
+from contextlib import contextmanager
+
+# Current analysis run; each Streamlit script thread sees its own value
+_run = contextvars.ContextVar('promotion_run', default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the run ID and any extra={'data': {...}} fields merged in.
+    """
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'run_id': getattr(record, 'run_id', None)
+        }
+        entry.update(getattr(record, 'data', None) or {})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() folds the traceback into msg and drops exc_info; keep it for JsonFormatter
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class RunContextFilter(logging.Filter):
+    # Runs on the QueueHandler, i.e. in the calling thread, before the record leaves it
+    def filter(self, record):
+        run = _run.get()
+        record.run_id = run['run_id'] if run else None
+        return True
+
+
+def start_run(*inputs):
+    """
+    Start a new analysis run for the current thread.
+
+    Parameters:
+    *inputs (bytes): Uploaded file contents; size plus first/last 64KB are hashed to identify the input
+
+    Returns:
+    dict: Run context with run_id, input_hash, rows and stages
+    """
+    # Fingerprint rather than full hash, so a 10MB upload costs microseconds on the script thread
+    digest = hashlib.sha256()
+    for data in inputs:
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data[:65536])
+        digest.update(data[-65536:])
+    run = {'run_id': uuid.uuid4().hex[:12], 'input_hash': digest.hexdigest()[:16], 'rows': {}, 'stages': {}}
+    _run.set(run)
+    return run
+
+
+def bind_run(run):
+    """
+    Re-attach an earlier run (e.g. from st.session_state) to the current thread.
+    """
+    _run.set(run)
+
+
+@contextmanager
+def run_stage(name):
+    """
+    Record the first duration of a stage on the current run.
+
+    Stages that first finish after end_run (e.g. charts) get one INFO record; Streamlit reruns every tab on
+    every interaction, so repeats are logged at DEBUG, below the logger's INFO level.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        run = _run.get()
+        if run is not None:
+            duration = round(time.perf_counter() - start, 4)
+            first = name not in run['stages']
+            if first:
+                run['stages'][name] = duration
+            if run.get('ended'):
+                logger.log(logging.INFO if first else logging.DEBUG, "Stage finished", extra={'data': {'stage': name, 'duration': duration}})
+
+
+def record_rows(name, count):
+    run = _run.get()
+    if run is not None:
+        run['rows'][name] = count
+
+
+def end_run(status='ok'):
+    """
+    Log the summary record of the current run: input hash, row counts and stage durations.
+    """
+    run = _run.get()
+    if run is not None:
+        run['ended'] = True
+        logger.info("Analysis run finished", extra={'data': {
+            'status': status,
+            'input_hash': run['input_hash'],
+            'rows': run['rows'],
+            'stages': run['stages']
+        }})
+
 
 # Create logger
 logger = logging.getLogger('promotion_app')
-logger.setLevel(logging.ERROR)
+logger.setLevel(logging.INFO)
+
+_listener = None
+
+
+def configure_logging(log_file='app.log', max_bytes=5 * 1024 * 1024, backup_count=3):
+    """
+    (Re)attach the pipeline: logger -> queue -> listener thread -> rotating JSON file.
+    """
+    global _listener
+    shutdown_logging()
+
+    file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(RunContextFilter())
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    logger.addHandler(queue_handler)
 
-# Create file handler
-log_file = 'app.log'
-if not os.path.exists(log_file):
-    open(log_file, 'w').close()
 
-file_handler = logging.FileHandler(log_file)
-file_handler.setLevel(logging.ERROR)
+def shutdown_logging():
+    """
+    Drain the queue, stop the listener thread and close the log file.
+    """
+    global _listener
+    for handler in [h for h in logger.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+        logger.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
 
-# Create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(formatter)
 
-# Add handler to logger
-logger.addHandler(file_handler)
\ No newline at end of file
+atexit.register(shutdown_logging)
+if not logger.handlers:
+    configure_logging()
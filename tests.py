@@ -3,8 +3,16 @@ import pandas as pd
 import tempfile
 import os
 import io
+import zipfile
 from data_preprocessing import load_and_preprocess
-from business_logic import calculate_demand
+from business_logic import calculate_demand, build_group_index, select_rows, index_options
+from file_validation import read_xlsx_headers, validate_xlsx, MAX_FILE_SIZE
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import update_check
+import json
+import logging
+from logger import JsonFormatter, RunContextFilter, start_run, bind_run, run_stage, record_rows, end_run, logger, configure_logging, shutdown_logging
 
 class TestPromotionApp(unittest.TestCase):
 
@@ -220,15 +228,282 @@ class TestPromotionApp(unittest.TestCase):
         file_b_bytes = bio_b.getvalue()
 
         df = load_and_preprocess(file_a_bytes, file_b_bytes)
-        df_result, summary = calculate_demand(df, lead_time=2)
+        df_result, summary, _ = calculate_demand(df, lead_time=2)
         # Daily Sales Rate = max(0, 30/30) = 1
         # Site Target % = 0.5
         # Regular Demand = 1 * (10 + 2) = 12
         # Promo Demand = 5 * 0.5 = 2.5
         # Total Demand = 12 + 2.5 = 14.5
         # Net Demand = 14.5 - (2+1) + 0 = 11.5
-        # Suggested Dispatch = max(11.5, 1) = 11.5
-        self.assertAlmostEqual(df_result['Suggested Dispatch Qty'].iloc[0], 11.5)
+        # Suggested Dispatch = ceil(max(11.5, 1) / MOQ 1) * 1 = 12 (RF rounds up to the MOQ multiple)
+        self.assertAlmostEqual(df_result['Suggested Dispatch Qty'].iloc[0], 12)
+
+    def test_preflight_reads_headers_and_rows(self):
+        df_b1 = pd.DataFrame({
+            'Group No.': [1, 2, 3],
+            'Article': ['1', '2', '3'],
+            'SKU Target': [10, 20, 30],
+            'Target Type': ['HK', 'MO', 'ALL'],
+            'Promotion Days': [7, 7, 7],
+            'Target Cover Days': [14, 14, 14]
+        })
+        bio_b = io.BytesIO()
+        with pd.ExcelWriter(bio_b) as writer:
+            df_b1.to_excel(writer, sheet_name='Sheet 1', index=False)
+        file_b_bytes = bio_b.getvalue()
+
+        sheets = read_xlsx_headers(file_b_bytes)
+        self.assertEqual(list(sheets), ['Sheet 1'])
+        self.assertEqual(sheets['Sheet 1']['columns'], df_b1.columns.tolist())
+        self.assertEqual(sheets['Sheet 1']['rows'], 4)
+
+        errors = validate_xlsx(file_b_bytes, {'Sheet 1': df_b1.columns.tolist(), 'Sheet 2': ['Site']}, 'File B')
+        self.assertEqual(len(errors), 1)
+        self.assertIn('Sheet 2', errors[0])
+
+    def test_preflight_rejects_invalid_and_oversized(self):
+        self.assertEqual(len(validate_xlsx(b'not an xlsx', {0: ['Article']}, 'File A')), 1)
+        self.assertEqual(len(validate_xlsx(b'0' * (MAX_FILE_SIZE + 1), {0: ['Article']}, 'File A')), 1)
+        result = load_and_preprocess(b'not an xlsx', b'not an xlsx')
+        self.assertTrue(result.empty)
+
+    def test_preflight_reads_shared_strings(self):
+        bio = io.BytesIO()
+        pd.DataFrame({'Site': ['S001'], 'Article': ['1']}).to_excel(bio, index=False)
+        ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+        header_strings = (
+            f'<sst {ns} count="4" uniqueCount="4">'
+            '<si><t>Article</t><rPh sb="0" eb="1"><t>ph</t></rPh></si>'
+            '<si><r><t>Si</t></r><r><rPr><b/></rPr><t>te</t></r><rPh sb="0" eb="1"><t>ph</t></rPh></si>'
+            '<si><t>Not a header</t></si>'
+        )
+
+        def build(shared_strings):
+            src = zipfile.ZipFile(io.BytesIO(bio.getvalue()))
+            out = io.BytesIO()
+            with zipfile.ZipFile(out, 'w') as dst:
+                for name in src.namelist():
+                    data = src.read(name)
+                    if name == 'xl/worksheets/sheet1.xml':
+                        data = data.replace(b't="inlineStr"><is><t>Site</t></is>', b't="s"><v>1</v>', 1)
+                        data = data.replace(b't="inlineStr"><is><t>Article</t></is>', b't="s"><v>0</v>', 1)
+                    elif name == '[Content_Types].xml':
+                        data = data.replace(b'</Types>', b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>')
+                    dst.writestr(name, data)
+                dst.writestr('xl/sharedStrings.xml', shared_strings)
+            return out.getvalue()
+
+        # Well-formed: phonetic runs are skipped, matching what pd.read_excel sees
+        file_bytes = build(header_strings + '<si><t>Also not a header</t></si></sst>')
+        sheets = read_xlsx_headers(file_bytes)
+        self.assertEqual(sheets['Sheet1']['columns'], ['Site', 'Article'])
+        self.assertEqual(sheets['Sheet1']['columns'], pd.read_excel(io.BytesIO(file_bytes)).columns.tolist())
+
+        # Truncated after the header strings: parsing must stop at the last needed index
+        truncated = build(header_strings + '<si><t>broken')
+        self.assertEqual(validate_xlsx(truncated, {0: ['Site', 'Article']}, 'File A'), [])
+
+    def test_preflight_reports_malformed_workbook(self):
+        bio = io.BytesIO()
+        pd.DataFrame({'Article': ['1']}).to_excel(bio, index=False)
+        src = zipfile.ZipFile(io.BytesIO(bio.getvalue()))
+        bad = io.BytesIO()
+        with zipfile.ZipFile(bad, 'w') as dst:
+            for name in src.namelist():
+                data = src.read(name)
+                if name == 'xl/worksheets/sheet1.xml':
+                    # Non-integer shared string index in the header cell
+                    data = data.replace(b't="inlineStr"><is><t>Article</t></is>', b't="s"><v>x</v>', 1)
+                dst.writestr(name, data)
+        errors = validate_xlsx(bad.getvalue(), {0: ['Article']}, 'File A')
+        self.assertEqual(len(errors), 1)
+        self.assertIn('File A', errors[0])
+
+    def test_group_index_matches_boolean_filters(self):
+        df = pd.DataFrame({
+            'Article': ['1', '1', '2', '2', '3'],
+            'Article Description': ['desc'] * 5,
+            'RP Type': ['RF', 'RF', 'ND', 'RF', 'RF'],
+            'Site': ['D001', 'S001', 'S002', 'D001', 'S001'],
+            'MOQ': [1, 2, 1, 1, 3],
+            'SaSa Net Stock': [10, 5, 0, 7, 1],
+            'Pending Received': [0, 1, 2, 0, 0],
+            'Safety Stock': [0, 1, 0, 0, 1],
+            'Last Month Sold Qty': [30, 60, 15, 0, 90],
+            'MTD Sold Qty': [2, 4, 1, 0, 5],
+            'Supply source': [1, 2, 4, 1, 2],
+            'Description p. group': ['group'] * 5,
+            'Notes': [''] * 5,
+            'Group No.': [1, 1, 2, 2, 1],
+            'SKU Target': [5, 5, 10, 10, 3],
+            'Target Type': ['HK', 'HK', 'MO', 'MO', 'ALL'],
+            'Promotion Days': [7] * 5,
+            'Target Cover Days': [10] * 5,
+            'Shop Target(HK)': [0.5] * 5,
+            'Shop Target(MO)': [0.3] * 5,
+            'Shop Target(ALL)': [0.2] * 5
+        })
+        df_result, summary, index = calculate_demand(df, lead_time=2)
+        pd.testing.assert_frame_equal(
+            select_rows(df_result, build_group_index(df_result, summary), parts=('d001', 'non_d001')),
+            select_rows(df_result, index, parts=('d001', 'non_d001'))
+        )
+        self.assertEqual(len(summary), 3)
+        self.assertEqual(summary['D001_Blocked'].sum(), 0)
+
+        non_d001 = df_result[df_result['Site'] != 'D001']
+        pd.testing.assert_frame_equal(select_rows(df_result, index), non_d001)
+        pd.testing.assert_frame_equal(
+            select_rows(df_result, index, group=1),
+            non_d001[non_d001['Group No.'] == 1]
+        )
+        pd.testing.assert_frame_equal(
+            select_rows(df_result, index, parts=('d001', 'non_d001'), group=2),
+            df_result[df_result['Group No.'] == 2]
+        )
+        pd.testing.assert_frame_equal(
+            select_rows(summary, index, parts=('summary',), group=1),
+            summary[summary['Group No.'] == 1]
+        )
+        pd.testing.assert_frame_equal(
+            select_rows(df_result, index, parts=('d001', 'non_d001'), group=1, article='1'),
+            df_result[(df_result['Group No.'] == 1) & (df_result['Article'] == '1')]
+        )
+        self.assertTrue(select_rows(df_result, index, article='999').empty)
+        pd.testing.assert_frame_equal(
+            select_rows(df_result, index, parts=('d001', 'non_d001'), site='D001'),
+            df_result[df_result['Site'] == 'D001']
+        )
+        # Site does not apply to the summary and is ignored there
+        pd.testing.assert_frame_equal(
+            select_rows(summary, index, parts=('summary',), group=1, site='S001'),
+            summary[summary['Group No.'] == 1]
+        )
+        self.assertEqual(index_options(index, 'site', parts=('d001', 'non_d001')), ['D001', 'S001', 'S002'])
+
+        # Unmatched articles get Group No. 0 next to string group IDs
+        mixed = df.copy()
+        mixed['Group No.'] = ['G1', 0, 'G1', 0, 'G2']
+        df_result, summary, index = calculate_demand(mixed, lead_time=2)
+        self.assertEqual(index_options(index, 'group'), [0, 'G1', 'G2'])
+
+    def test_update_check_local_file_and_cache(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            version_file = os.path.join(tmp, 'VERSION.md')
+            cache_file = os.path.join(tmp, 'cache.json')
+            with open(version_file, 'w', encoding='utf-8') as f:
+                f.write('# Version 2.0\n')
+            self.assertEqual(update_check.fetch_remote_version(version_file, cache_file), '2.0')
+
+            # Served from cache within the TTL, even after the file changes
+            with open(version_file, 'w', encoding='utf-8') as f:
+                f.write('# Version 3.0\n')
+            self.assertEqual(update_check.fetch_remote_version(version_file, cache_file), '2.0')
+            update_check._memory_cache.clear()
+            self.assertEqual(update_check.fetch_remote_version(version_file, cache_file), '2.0')
+            self.assertEqual(update_check.fetch_remote_version(version_file, cache_file, ttl=0), '3.0')
+
+    def test_update_check_etag(self):
+        requests_seen = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests_seen.append(self.headers.get('If-None-Match'))
+                if self.headers.get('If-None-Match') == '"v2"':
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = b'# Version 2.0\n'
+                self.send_response(200)
+                self.send_header('ETag', '"v2"')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/VERSION.md"
+            with tempfile.TemporaryDirectory() as tmp:
+                cache_file = os.path.join(tmp, 'cache.json')
+                self.assertEqual(update_check.fetch_remote_version(url, cache_file, ttl=0), '2.0')
+                self.assertEqual(update_check.fetch_remote_version(url, cache_file, ttl=0), '2.0')
+                future = update_check.start_update_check(url, cache_file)
+                self.assertEqual(future.result(timeout=5), '2.0')
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(requests_seen[:2], [None, '"v2"'])
+
+    def test_structured_log_record_carries_run(self):
+        run = start_run(b'file a', b'file b')
+        try:
+            with run_stage('load_and_preprocess'):
+                record_rows('raw', 5)
+            record = logging.getLogger('promotion_app').makeRecord(
+                'promotion_app', logging.ERROR, __file__, 0, "Error in %s", ('calculate_demand',), None,
+                extra={'data': {'rows': run['rows']}}
+            )
+            self.assertTrue(RunContextFilter().filter(record))
+            entry = json.loads(JsonFormatter().format(record))
+        finally:
+            bind_run(None)
+
+        self.assertEqual(entry['run_id'], run['run_id'])
+        self.assertEqual(entry['message'], 'Error in calculate_demand')
+        self.assertEqual(entry['rows'], {'raw': 5})
+        self.assertIn('load_and_preprocess', run['stages'])
+        self.assertEqual(len(run['input_hash']), 16)
+
+    def test_logging_pipeline_writes_rotating_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_file = os.path.join(tmp, 'app.log')
+            configure_logging(log_file, max_bytes=2048, backup_count=9)
+            try:
+                run = start_run(b'file a', b'file b')
+                with run_stage('load_and_preprocess'):
+                    record_rows('raw', 5)
+                try:
+                    raise ValueError('bad value')
+                except ValueError:
+                    logger.exception("Error in calculate_demand")
+                end_run()
+                # Every rerun redraws the charts; only the first one is written
+                for _ in range(3):
+                    with run_stage('create_visualizations'):
+                        pass
+                # Enough records to roll the 2KB file over
+                for i in range(25):
+                    logger.error(f"filler {i}")
+            finally:
+                bind_run(None)
+                shutdown_logging()
+
+            lines = []
+            for name in [f"{log_file}.{i}" for i in range(9, 0, -1)] + [log_file]:
+                if os.path.exists(name):
+                    with open(name, encoding='utf-8') as f:
+                        lines += [json.loads(line) for line in f]
+            self.assertTrue(os.path.exists(log_file + '.1'))
+        configure_logging()
+
+        error = next(line for line in lines if line['message'] == 'Error in calculate_demand')
+        self.assertEqual(error['run_id'], run['run_id'])
+        self.assertIn('ValueError: bad value', error['exc_info'])
+
+        summary = next(line for line in lines if line['message'] == 'Analysis run finished')
+        self.assertEqual(summary['run_id'], run['run_id'])
+        self.assertEqual(summary['input_hash'], run['input_hash'])
+        self.assertEqual(summary['rows'], {'raw': 5})
+        self.assertIn('load_and_preprocess', summary['stages'])
+
+        stages = [line for line in lines if line['message'] == 'Stage finished']
+        self.assertEqual(len(stages), 1)
+        self.assertEqual(stages[0]['stage'], 'create_visualizations')
+        self.assertEqual(run['stages']['create_visualizations'], stages[0]['duration'])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
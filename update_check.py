@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+import requests
+from logger import logger
+
+# Remote VERSION.md: a GitHub contents API URL, a raw URL, a file:// URL or a local path
+UPDATE_URL = os.environ.get('PROMOTION_UPDATE_URL', "https://api.github.com/repos/example/repo/contents/VERSION.md")
+CACHE_FILE = os.environ.get('PROMOTION_UPDATE_CACHE', '.update_cache.json')
+CACHE_TTL = 3600  # seconds
+TIMEOUT = 3  # seconds, connect and read
+
+_session = requests.Session()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='update_check')
+_lock = threading.Lock()
+_memory_cache = {}
+
+
+def parse_version(content):
+    """
+    Extract the version from the first line of VERSION.md, e.g. '# Version 1.0' -> '1.0'.
+    """
+    return content.split('\n')[0].strip().replace('# Version ', '')
+
+
+def read_local_version(path='VERSION.md'):
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_version(f.read())
+
+
+def _decode(text):
+    # GitHub contents API wraps the file in JSON with base64 content; anything else is the file itself
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(data, dict) and 'content' in data:
+        return base64.b64decode(data['content']).decode('utf-8')
+    return text
+
+
+def _load_disk_cache(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_disk_cache(cache_file, url, entry):
+    cache = _load_disk_cache(cache_file)
+    cache[url] = entry
+    tmp = cache_file + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        logger.error(f"Error saving update cache: {str(e)}")
+
+
+def _cached_entry(url, cache_file):
+    entry = _memory_cache.get(url)
+    if entry is None:
+        entry = _load_disk_cache(cache_file).get(url)
+        if entry is not None:
+            _memory_cache[url] = entry
+    return entry
+
+
+def fetch_remote_version(url=None, cache_file=None, ttl=None, timeout=None):
+    """
+    Get the remote version, served from the memory/disk cache while it is younger than the TTL.
+
+    Parameters:
+    url (str): Endpoint, defaults to UPDATE_URL
+    cache_file (str): Disk cache path, defaults to CACHE_FILE
+    ttl (int): Cache lifetime in seconds, defaults to CACHE_TTL
+    timeout (float): Request timeout in seconds, defaults to TIMEOUT
+
+    Returns:
+    str: Remote version
+    """
+    url = url or UPDATE_URL
+    cache_file = cache_file or CACHE_FILE
+    ttl = CACHE_TTL if ttl is None else ttl
+    timeout = TIMEOUT if timeout is None else timeout
+
+    with _lock:
+        entry = _cached_entry(url, cache_file)
+    if entry is not None and time.time() - entry['checked_at'] < ttl:
+        return entry['version']
+
+    scheme = urlparse(url).scheme
+    if scheme in ('http', 'https'):
+        headers = {}
+        if entry is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        response = _session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            entry = dict(entry, checked_at=time.time())
+        else:
+            response.raise_for_status()
+            entry = {
+                'version': parse_version(_decode(response.text)),
+                'etag': response.headers.get('ETag'),
+                'checked_at': time.time()
+            }
+    else:
+        path = url2pathname(urlparse(url).path) if scheme == 'file' else url
+        with open(path, 'r', encoding='utf-8') as f:
+            entry = {'version': parse_version(_decode(f.read())), 'etag': None, 'checked_at': time.time()}
+
+    with _lock:
+        _memory_cache[url] = entry
+        _save_disk_cache(cache_file, url, entry)
+    return entry['version']
+
+
+def start_update_check(url=None, cache_file=None):
+    """
+    Run fetch_remote_version on the background worker so the script thread never waits on the network.
+
+    Returns:
+    concurrent.futures.Future: Resolves to the remote version
+    """
+    return _executor.submit(fetch_remote_version, url, cache_file)
@@ -5,28 +5,30 @@ import pandas as pd
 import numpy as np
 import matplotlib
 from logger import logger
+from business_logic import build_group_index, select_rows, index_options
 
 # Set font for Chinese characters
 matplotlib.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans', 'Arial Unicode MS']
 matplotlib.rcParams['axes.unicode_minus'] = False
 
-def create_visualizations(df, summary):
+def create_visualizations(df, summary, index=None):
     try:
         if df.empty or summary.empty:
             st.info("無視覺化資料可用")
             return
 
+        # Group index built once per analysis in app.py; build it here only if the caller has none
+        if not index or 'summary' not in index:
+            index = build_group_index(df, summary)
+
         # Selectbox for Group No. filtering
-        group_options = ['All'] + sorted(summary['Group No.'].unique().tolist())
+        group_options = ['All'] + index_options(index, 'group')
         selected_group = st.selectbox("選擇組別編號篩選圖表", group_options)
 
         # Filter data, exclude D001
-        df_filtered = df[df['Site'] != 'D001']
-        summary_filtered = summary
-
-        if selected_group != 'All':
-            df_filtered = df_filtered[df_filtered['Group No.'] == selected_group]
-            summary_filtered = summary_filtered[summary_filtered['Group No.'] == selected_group]
+        group = None if selected_group == 'All' else selected_group
+        df_filtered = select_rows(df, index, group=group)
+        summary_filtered = select_rows(summary, index, parts=('summary',), group=group)
 
         if df_filtered.empty or summary_filtered.empty:
             st.info("No visualization data available")